@@ -1,6 +1,7 @@
 import json
 import exercises
 import os
+import numpy as np
 import matplotlib.pyplot as plt
 import code
 from datetime import datetime, timedelta
@@ -30,10 +31,23 @@ def filter_exercises(exercise_list, equipment=None, grip=None, execution=None):
 
     return filtered_exercise_list
 
-def plot_progression(muscle_or_exercise, metric="weight"):
+def estimated_1rm(reps, weight):
     """
-    Plots progression of a given metric (weight, reps, sets or volume) over time for a muscle or exercise.
+    Estimates the one rep max of a set with the Epley formula
     """
+    return weight * (1 + reps / 30)
+
+def plot_progression(muscle_or_exercise, metric="weight", forecast=False, window_days=56, log=False):
+    """
+    Plots progression of a given metric (weight, e1rm, reps, sets or volume) over time for a muscle or exercise.
+    If forecast is True, the trend fitted by forecast_progression() is drawn on top (weight, e1rm and volume only).
+    """
+    if forecast:
+        if metric not in ("weight", "e1rm", "volume"):
+            raise ValueError(f"Cannot forecast metric '{metric}' (use 'weight', 'e1rm' or 'volume')")
+        if id(muscle_or_exercise) not in _progression_index:
+            raise ValueError(f"Cannot forecast {muscle_or_exercise!r}, only objects in all_exercises or all_muscles have a forecast")
+
     dates = []
     values = []
     date_previous = None
@@ -44,6 +58,8 @@ def plot_progression(muscle_or_exercise, metric="weight"):
         
         if metric == "weight":
             value = max(record["weight"])
+        elif metric == "e1rm":
+            value = max(estimated_1rm(r, w) for r, w in zip(record["reps"], record["weight"]))
         elif metric == "reps":
             value = sum(record["reps"])
         elif metric == "volume":
@@ -53,8 +69,11 @@ def plot_progression(muscle_or_exercise, metric="weight"):
         else:
             raise ValueError(f"Unknown metric '{metric}'")
         if date == date_previous:
-            # Update the last entry
-            values[-1] += value
+            # Update the last entry, heaviest set of the day for weight / e1rm, total for the rest
+            if metric in ("weight", "e1rm"):
+                values[-1] = max(values[-1], value)
+            else:
+                values[-1] += value
         else:           
             dates.append(date)
             values.append(value)
@@ -68,10 +87,30 @@ def plot_progression(muscle_or_exercise, metric="weight"):
     
     # --- Plot styling ---
     
+    if forecast:
+        fit = _fit_progression(metric, window_days, log)
+        i = _progression_index[id(muscle_or_exercise)]
+
     fig, ax = plt.subplots(facecolor="#0d0d0d")
     ax.set_facecolor("#0d0d0d")
-    ax.set_ylim(0, max(x for x in values if x is not None) * 1.1)
+    y_max = max(x for x in values if x is not None)
     ax.plot(dates, values, marker='o', color="#00bfff", linewidth=2)
+
+    if forecast:
+        if fit["valid"][i]:
+            # Draw the fitted trend from the first session in the window to 4 weeks after the last session
+            x = np.linspace(fit["first_day"][i] - fit["last_day"][i], 28, 30)
+            trend = fit["intercept"][i] + fit["slope"][i] * x
+            if log:
+                trend = np.exp(trend)
+            trend_dates = [datetime.fromordinal(int(fit["last_day"][i])) + timedelta(days=float(d)) for d in x]
+            ax.plot(trend_dates, trend, linestyle="--", color="#ff8c00", linewidth=1.5, label="Forecast")
+            ax.legend(facecolor="#0d0d0d", labelcolor="white")
+            y_max = max(y_max, trend.max())
+        else:
+            print(f"Not enough data to forecast {muscle_or_exercise.name} ({metric})")
+
+    ax.set_ylim(0, y_max * 1.1)
     ax.set_title(f"{muscle_or_exercise.name.capitalize()} Progression ({metric.capitalize()})", color="white")
     ax.set_xlabel("Date", color="white")
     ax.set_ylabel(metric.capitalize(), color="white")
@@ -86,6 +125,165 @@ def plot_progression(muscle_or_exercise, metric="weight"):
     plt.tight_layout()
     plt.show()
 
+# Every exercise and muscle is one series for forecasting, identified by its index in this list
+_progression_series = all_exercises + all_muscles
+_progression_index = {id(obj): i for i, obj in enumerate(_progression_series)}
+# Flat per-record arrays of all series, only records added since the last call are appended
+_progression_cache = {
+    "seen": [0] * len(_progression_series),
+    "series": np.empty(0, dtype=np.int64),
+    "day": np.empty(0, dtype=np.int64),
+    "weight": np.empty(0),
+    "e1rm": np.empty(0),
+    "volume": np.empty(0),
+}
+
+def _update_progression_cache():
+    """
+    Appends the history records that arrived since the last call to _progression_cache
+    """
+    new = {"series": [], "day": [], "weight": [], "e1rm": [], "volume": []}
+    days = {}  # parse each date string only once
+    for i, obj in enumerate(_progression_series):
+        for record in obj.history[_progression_cache["seen"][i]:]:
+            if record["date"] not in days:
+                days[record["date"]] = datetime.fromisoformat(record["date"]).toordinal()
+            new["series"].append(i)
+            new["day"].append(days[record["date"]])
+            new["weight"].append(max(record["weight"]))
+            new["e1rm"].append(max(estimated_1rm(r, w) for r, w in zip(record["reps"], record["weight"])))
+            new["volume"].append(sum(record["volume"]))
+        _progression_cache["seen"][i] = len(obj.history)
+
+    if new["series"]:
+        for key, values in new.items():
+            _progression_cache[key] = np.concatenate([_progression_cache[key], np.asarray(values, dtype=_progression_cache[key].dtype)])
+
+def _fit_progression(metric="e1rm", window_days=56, log=False, min_sessions=3, iterations=5):
+    """
+    Fits a robust (Huber) linear trend of metric per session day over the last window_days of every series at once.
+    Days are relative to the last session of each series, so the intercept is the trend value at that session.
+    If log is True the trend is fitted on log(metric), i.e. a constant percentage change per day.
+    """
+    if metric not in ("weight", "e1rm", "volume"):
+        raise ValueError(f"Cannot forecast metric '{metric}' (use 'weight', 'e1rm' or 'volume')")
+
+    _update_progression_cache()
+    n_series = len(_progression_series)
+
+    # Merge records of the same series on the same day into one session, like plot_progression does:
+    # heaviest of the day for weight / e1rm, total for volume
+    keys, inverse = np.unique(_progression_cache["series"] * 2**32 + _progression_cache["day"], return_inverse=True)
+    if metric == "volume":
+        y = np.bincount(inverse, weights=_progression_cache[metric], minlength=len(keys))
+    else:
+        y = np.full(len(keys), -np.inf)
+        np.maximum.at(y, inverse, _progression_cache[metric])
+    series = keys // 2**32
+    day = keys % 2**32
+
+    last_day = np.zeros(n_series, dtype=np.int64)
+    np.maximum.at(last_day, series, day)
+    x = (day - last_day[series]).astype(float)
+
+    keep = x >= -window_days
+    if log:
+        keep &= y > 0
+    series, x, y = series[keep], x[keep], y[keep]
+    if log:
+        y = np.log(y)
+
+    count = np.bincount(series, minlength=n_series)
+    first_day = last_day.copy()
+    np.minimum.at(first_day, series, day[keep])
+    w = np.ones_like(y)
+    slope = np.zeros(n_series)
+    intercept = np.zeros(n_series)
+    for _ in range(iterations):
+        # Weighted least squares for all series through per-series sums
+        sw = np.bincount(series, weights=w, minlength=n_series)
+        sx = np.bincount(series, weights=w * x, minlength=n_series)
+        sy = np.bincount(series, weights=w * y, minlength=n_series)
+        sxx = np.bincount(series, weights=w * x * x, minlength=n_series)
+        sxy = np.bincount(series, weights=w * x * y, minlength=n_series)
+        denom = sw * sxx - sx * sx
+        valid = (count >= min_sessions) & (denom > 1e-12)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(valid, (sw * sxy - sx * sy) / denom, 0.0)
+            intercept = np.where(sw > 0, (sy - slope * sx) / sw, 0.0)
+
+        # Huber weights, scale estimated from the mean absolute residual of each series
+        residual = np.abs(y - intercept[series] - slope[series] * x)
+        scale = 1.253 * np.bincount(series, weights=residual, minlength=n_series) / np.maximum(count, 1)
+        k = 1.345 * scale[series]
+        w = np.where(residual > k, k / np.maximum(residual, 1e-12), 1.0)
+
+    return {"count": count, "slope": slope, "intercept": intercept, "first_day": first_day, "last_day": last_day, "valid": valid}
+
+def forecast_progression(targets=None, metric="e1rm", muscle_metric="volume", window_days=56, log=False, plateau_threshold=0.005):
+    """
+    Fits a trend of the metric (e1rm, weight or volume) over the last window_days for every exercise,
+    and of muscle_metric for every muscle, flags each as progressing, plateau or regressing
+    and projects when a target will be reached.
+    A muscle's e1rm / weight on a day is the best of whichever exercises were done that day,
+    so its status follows exercise selection rather than strength, hence volume by default.
+    targets: number used for every series, or dictionary of exercise / muscle name -> target value.
+    plateau_threshold: weekly change (as fraction of the current value) below which a series counts as a plateau.
+    Returns {"exercises": {name: forecast}, "muscles": {name: forecast}}.
+    """
+    fit = _fit_progression(metric, window_days, log)
+    if muscle_metric != metric:
+        is_muscle = np.array([not isinstance(obj, exercises.Exercise) for obj in _progression_series])
+        muscle_fit = _fit_progression(muscle_metric, window_days, log)
+        fit = {key: np.where(is_muscle, muscle_fit[key], fit[key]) for key in fit}
+    slope, intercept, valid = fit["slope"], fit["intercept"], fit["valid"]
+
+    if targets is None:
+        target = np.full(len(_progression_series), np.nan)
+    elif isinstance(targets, dict):
+        targets = {name.lower(): value for name, value in targets.items()}
+        target = np.array([targets.get(obj.name, np.nan) for obj in _progression_series], dtype=float)
+    else:
+        target = np.full(len(_progression_series), float(targets))
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if log:
+            current = np.exp(intercept)
+            weekly_change = np.expm1(slope * 7)
+            days_to_target = (np.log(target) - intercept) / slope
+        else:
+            current = intercept
+            weekly_change = slope * 7 / current
+            days_to_target = (target - intercept) / slope
+            # A relative change means nothing without a positive current value (e.g. bodyweight logged as 0)
+            valid = valid & (current > 0)
+    days_to_target = np.where(target <= current, 0.0, days_to_target)
+
+    status = np.select(
+        [~valid, weekly_change >= plateau_threshold, weekly_change <= -plateau_threshold],
+        ["not enough data", "progressing", "regressing"],
+        "plateau"
+    )
+
+    report = {"exercises": {}, "muscles": {}}
+    for i, obj in enumerate(_progression_series):
+        if not obj.history:
+            continue
+        target_date = None
+        if valid[i] and np.isfinite(days_to_target[i]) and days_to_target[i] >= 0:
+            target_date = (datetime.fromordinal(int(fit["last_day"][i])) + timedelta(days=float(days_to_target[i]))).strftime("%Y-%m-%d")
+
+        group = "exercises" if isinstance(obj, exercises.Exercise) else "muscles"
+        report[group][obj.name] = {
+            "sessions": int(fit["count"][i]),
+            "status": str(status[i]),
+            "current": round(float(current[i]), 1) if valid[i] else None,
+            "weekly_change": round(float(weekly_change[i]), 4) + 0.0 if valid[i] else None,  # + 0.0 turns -0.0 into 0.0
+            "target": None if np.isnan(target[i]) else float(target[i]),
+            "target_date": target_date,
+        }
+    return report
+
 # Loop through all wokrout files and train muscles/exercises accordingly, 
 # storing data in all_exercises_data and each muscle / exercise history
 for filename in sorted(os.listdir(past_workouts_folder)):
@@ -220,12 +418,117 @@ def add_workout_session():
     with open(filepath, "w") as f:
         json.dump(session_data, f, indent=4)
 
+def export_history(filepath="history.parquet", row_group_size=2048):
+    """
+    Exports the full set-level history of every exercise to a columnar file (one row per set).
+    Uses Parquet for .parquet files and Arrow IPC for .arrow / .feather files.
+    Exercise, muscle, equipment, grip and execution columns are dictionary-encoded.
+    Rows are sorted by exercise, then date. In Parquet every row group holds one exercise in one year
+    (at most row_group_size sets), so load_history() can skip row groups by exercise and date statistics.
+    """
+    import pyarrow as pa  # optional dependency, only needed for export / snapshots
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    columns = {
+        "date": [], "exercise": [], "muscles": [], "equipment": [], "grip": [], "execution": [],
+        "set_number": [], "reps": [], "weight": [], "volume": []
+    }
+    # Sorting by exercise, then date keeps the min/max statistics of each row group narrow on both columns
+    records = [(record["date"], exercise_obj.name, exercise_obj, record) for exercise_obj in all_exercises for record in exercise_obj.history]
+    records.sort(key=lambda x: (x[1], x[0]))
+
+    for date, name, exercise_obj, record in records:
+        date = datetime.strptime(date, "%Y-%m-%d").date()
+        muscle_names = [m.name for m in exercise_obj.muscles]
+        for set_number, (reps, weight, volume) in enumerate(zip(record["reps"], record["weight"], record["volume"]), start=1):
+            columns["date"].append(date)
+            columns["exercise"].append(name)
+            columns["muscles"].append(muscle_names)
+            columns["equipment"].append(record["equipment"].lower())
+            columns["grip"].append(record["grip"].lower())
+            columns["execution"].append(record["execution"].lower())
+            columns["set_number"].append(set_number)
+            columns["reps"].append(reps)
+            columns["weight"].append(weight)
+            columns["volume"].append(volume)
+
+    category = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([
+        ("date", pa.date32()),
+        ("exercise", category),
+        ("muscles", pa.list_(category)),
+        ("equipment", category),
+        ("grip", category),
+        ("execution", category),
+        ("set_number", pa.int16()),
+        ("reps", pa.int32()),
+        ("weight", pa.float64()),
+        ("volume", pa.float64()),
+    ])
+    table = pa.table(columns, schema=schema)
+
+    if filepath.endswith(".parquet"):
+        # Arrow does not prune row groups on dictionary-typed columns, so exercise is stored as plain strings
+        # (Parquet still dictionary-encodes the pages) and dictionary-encoded again by load_history()
+        table = table.set_column(1, "exercise", table["exercise"].cast(pa.string()))
+        # Start a new row group whenever the exercise or the year changes, so groups stay narrow on both
+        starts = [i for i in range(len(columns["date"])) if i == 0
+                  or columns["exercise"][i] != columns["exercise"][i - 1]
+                  or columns["date"][i].year != columns["date"][i - 1].year]
+        with pq.ParquetWriter(filepath, table.schema, write_statistics=True, use_dictionary=True) as writer:
+            for start, end in zip(starts, starts[1:] + [table.num_rows]):
+                writer.write_table(table.slice(start, end - start), row_group_size=row_group_size)
+    elif filepath.endswith(".arrow") or filepath.endswith(".feather"):
+        # Uncompressed so the file can be memory-mapped without copying
+        feather.write_feather(table, filepath, compression="uncompressed", chunksize=row_group_size)
+    else:
+        raise ValueError(f"Unknown file format for '{filepath}' (use .parquet, .arrow or .feather)")
+
+    print(f"Exported {table.num_rows} sets to {filepath}")
+
+def load_history(filepath="history.parquet", start_date=None, end_date=None, exercise=None):
+    """
+    Loads a history file written by export_history() as a pyarrow Table, without re-running ingestion.
+    The file is memory-mapped; Arrow IPC files are read zero-copy.
+    start_date / end_date ('YYYY-MM-DD', inclusive) and exercise (name or list of names) filter the rows.
+    For Parquet, row groups whose exercise or date statistics fall outside the filter are never read;
+    Arrow IPC files have no such statistics, so they are filtered after mapping.
+    """
+    import pyarrow as pa  # optional dependency, only needed for export / snapshots
+    import pyarrow.parquet as pq
+
+    if isinstance(exercise, str):
+        exercise = [exercise]
+
+    predicates = []
+    if start_date:
+        predicates.append(("date", ">=", datetime.strptime(start_date, "%Y-%m-%d").date()))
+    if end_date:
+        predicates.append(("date", "<=", datetime.strptime(end_date, "%Y-%m-%d").date()))
+    if exercise:
+        predicates.append(("exercise", "in", [name.lower() for name in exercise]))
+
+    if filepath.endswith(".parquet"):
+        table = pq.read_table(filepath, filters=predicates or None, memory_map=True)
+        return table.set_column(1, "exercise", table["exercise"].dictionary_encode())
+    elif filepath.endswith(".arrow") or filepath.endswith(".feather"):
+        table = pa.ipc.open_file(pa.memory_map(filepath, "r")).read_all()
+        if not predicates:
+            return table
+        return table.filter(pq.filters_to_expression(predicates))
+    else:
+        raise ValueError(f"Unknown file format for '{filepath}' (use .parquet, .arrow or .feather)")
+
 
 def help(command=None):
     if command is None:
         print("Available commands:")
         print(" - filter_exercises()")
         print(" - plot_progression()")
+        print(" - forecast_progression()")
+        print(" - export_history()")
+        print(" - load_history()")
         print(" - all_muscles_dict: dictionary of all muscles by name")
         print(" - all_exercises_dict: dictionary of all exercises by name")
         print("Type help('command_name') for more details.")
@@ -241,13 +544,44 @@ def help(command=None):
         print("Returns a list of Exercise objects that match the criteria.")
 
     elif command == "plot_progression" or command == "plot_progression()":
-        print("plot_progression(muscle_or_exercise, metric='weight')")
+        print("plot_progression(muscle_or_exercise, metric='weight', forecast=False, window_days=56, log=False)")
         print("Plots progression of a given metric over time for a muscle or exercise.")
         print("Parameters:")
         print(" - muscle_or_exercise: Muscle or Exercise object to plot progression for")
-        print(" - metric: metric to plot ('weight', 'reps', 'sets', 'volume') (string)")
+        print(" - metric: metric to plot ('weight', 'e1rm', 'reps', 'sets', 'volume') (string)")
+        print(" - forecast: draw the trend from forecast_progression() on top, only for 'weight', 'e1rm' and 'volume' (bool)")
+        print(" - window_days, log: passed on to the forecast, see help('forecast_progression')")
         print("Displays a plot of the specified metric over time.")
 
+    elif command == "forecast_progression" or command == "forecast_progression()":
+        print("forecast_progression(targets=None, metric='e1rm', muscle_metric='volume', window_days=56, log=False, plateau_threshold=0.005)")
+        print("Fits a robust trend for every exercise and muscle and flags them as progressing, plateau or regressing.")
+        print("Parameters:")
+        print(" - targets: target value for all, or dictionary of exercise / muscle name -> target value (number or dict)")
+        print(" - metric: metric to forecast for exercises ('e1rm' = estimated one rep max, 'weight', 'volume') (string)")
+        print(" - muscle_metric: metric to forecast for muscles, a muscle's e1rm / weight depends on which exercises were done (string)")
+        print(" - window_days: only sessions in the last window_days before the latest session are used (int)")
+        print(" - log: fit a constant percentage change instead of a constant change per day (bool)")
+        print(" - plateau_threshold: weekly change, as fraction of the current value, counted as a plateau (float)")
+        print("Returns {'exercises': {...}, 'muscles': {...}} with status, current value, weekly change and target date.")
+
+    elif command == "export_history" or command == "export_history()":
+        print("export_history(filepath='history.parquet', row_group_size=2048)")
+        print("Exports the full set-level history of all exercises to a columnar file (one row per set).")
+        print("Parameters:")
+        print(" - filepath: output file, .parquet for Parquet or .arrow / .feather for Arrow IPC (string)")
+        print(" - row_group_size: maximum number of sets per row group / record batch, Parquet also starts a new group per exercise and year (int)")
+        print("Requires pyarrow.")
+
+    elif command == "load_history" or command == "load_history()":
+        print("load_history(filepath='history.parquet', start_date=None, end_date=None, exercise=None)")
+        print("Memory-maps a file written by export_history() and returns it as a pyarrow Table.")
+        print("Parameters:")
+        print(" - filepath: file written by export_history() (string)")
+        print(" - start_date / end_date: only keep sets in this range, inclusive ('YYYY-MM-DD') (string)")
+        print(" - exercise: only keep sets of this exercise or list of exercises (string or list)")
+        print("Returns a pyarrow Table, use .to_pandas() for a DataFrame. Requires pyarrow.")
+
     elif command == "all_muscles_dict" or command == "all_muscles_dict()":
         print("all_muscles_dict: dictionary of all muscles by name")
         pprint(all_muscles_dict)